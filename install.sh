@@ -68,9 +68,17 @@ ES_URL="http://${ES_HOST}:${ES_PORT}"
 
 # Wait for Elasticsearch
 echo "Waiting for Elasticsearch to be ready at ${ES_URL}..."
+# Poll quickly at first and back off to every 2 seconds, so a fast start isn't followed by a long sleep
+delay_ms=100
+waited_ms=0
 until curl -s "${ES_URL}/_cluster/health" > /dev/null 2>&1; do
-    echo "  Still waiting..."
-    sleep 5
+    # Report progress roughly every 5 seconds
+    if [ $((waited_ms / 5000)) -ne $(((waited_ms + delay_ms) / 5000)) ]; then
+        echo "  Still waiting..."
+    fi
+    sleep "$((delay_ms / 1000)).$(printf '%03d' $((delay_ms % 1000)))"
+    waited_ms=$((waited_ms + delay_ms))
+    delay_ms=$((delay_ms * 3 / 2 > 2000 ? 2000 : delay_ms * 3 / 2))
 done
 echo "✓ Elasticsearch is ready"
 echo ""
@@ -2,28 +2,161 @@
 """
 Git Commits Analyzer
 Analyzes git commits with file filtering and generates data for Elasticsearch bulk upload.
-Parallelized version with thread-safe operations.
+Repositories are analyzed in parallel worker processes.
 Includes caching to skip re-analysis when repositories haven't changed.
 """
 
 import argparse
 import hashlib
-import json
 import os
 import re
 import subprocess
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import UTC, datetime
 from pathlib import Path
-from threading import Lock
+from typing import BinaryIO
 
+import orjson
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml, use the pure Python parser
+    from yaml import SafeLoader
+
+try:
+    import re._parser as re_parser
+except ImportError:  # Private CPython module, only used to find literals for the prefilter
+    re_parser = None
+
+try:
+    import hyperscan
+except ImportError:  # Optional: path filters fall back to Python's re engine
+    hyperscan = None
+
+try:
+    import re2
+except ImportError:  # Optional: used for path filters when Hyperscan isn't available
+    re2 = None
+
+try:
+    import ahocorasick
+except ImportError:  # Optional: literal prefilter falls back to substring checks
+    ahocorasick = None
+
+
+def required_literal(pattern: str) -> str:
+    """Return the longest literal substring every match of the pattern must contain, or "" if there is none."""
+    if re_parser is None:
+        return ""
+
+    # re._parser is no stable API; if its internals change, just go without the prefilter
+    try:
+        parsed = re_parser.parse(pattern)
+        if parsed.state.flags & (re.IGNORECASE | re.LOCALE):
+            return ""
+
+        # Consecutive literals in the top-level sequence have to appear verbatim in any match
+        longest = current = ""
+        for op, value in parsed:
+            if op is re_parser.LITERAL:
+                current += chr(value)
+                longest = max(longest, current, key=len)
+            else:
+                current = ""
+        return longest
+    except Exception:
+        return ""
+
+
+class LiteralPrefilter:
+    """Skips the regex match for paths that contain none of the literals the patterns require."""
+
+    def __init__(self, literals: set[str], matcher):
+        self.matcher = matcher
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for literal in literals:
+                self.automaton.add_word(literal, literal)
+            self.automaton.make_automaton()
+        else:
+            self.automaton = None
+            self.literals = tuple(literals)
+
+    def match(self, file_path: str) -> bool:
+        if self.automaton is not None:
+            if next(self.automaton.iter(file_path), None) is None:
+                return False
+        elif not any(literal in file_path for literal in self.literals):
+            return False
+        return bool(self.matcher.match(file_path))
+
+
+# Upper bound for remembered exclusion decisions per process
+EXCLUDE_CACHE_SIZE = 100_000
+
+
+def write_file_atomically(path: Path, data: bytes):
+    """Write data to a temporary file and rename it over path, so a crash never leaves a truncated file."""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("wb") as f:
+        f.write(data)
+    tmp_path.replace(path)
+
+
+class HyperscanPatternSet:
+    """Matches a path against many regexes in a single Hyperscan pass, like re.Pattern.match()."""
+
+    def __init__(self, patterns: list[str]):
+        self.database = hyperscan.Database()
+        self.database.compile(
+            # Anchor every pattern at the start to keep re.match() semantics
+            expressions=[f"^(?:{pattern})".encode() for pattern in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[
+                hyperscan.HS_FLAG_SINGLEMATCH
+                | hyperscan.HS_FLAG_ALLOWEMPTY
+                | hyperscan.HS_FLAG_UTF8
+                | hyperscan.HS_FLAG_UCP
+            ]
+            * len(patterns),
+        )
+        self.scratch = hyperscan.Scratch(self.database)
+
+    def match(self, file_path: str) -> bool:
+        try:
+            # Returning True from the handler stops the scan at the first match
+            self.database.scan(file_path.encode(), match_event_handler=lambda *_: True, scratch=self.scratch)
+        except hyperscan.ScanTerminated:
+            return True
+        return False
+
+
+class Re2PatternSet:
+    """Matches a path against many regexes in a single RE2 pass, like re.Pattern.match()."""
+
+    def __init__(self, patterns: list[str]):
+        options = re2.Options()
+        # Unsupported patterns are reported through re2.error, no need to also log them to stderr
+        options.log_errors = False
+        # MatchSet anchors every pattern at the start to keep re.match() semantics
+        self.pattern_set = re2.Set.MatchSet(options)
+        for pattern in patterns:
+            self.pattern_set.Add(pattern)
+        self.pattern_set.Compile()
+
+    def match(self, file_path: str) -> bool:
+        return self.pattern_set.Match(file_path) is not None
+
 
 class GitCommitsAnalyzer:
-    def __init__(self, config_file: str):
+    def __init__(self, config_file: str, full_rescan: bool = False):
         """Initialize the analyzer with configuration."""
+        self.config_file = config_file
+        self.full_rescan = full_rescan
         self.config = self.load_config(config_file)
         self.repos_dir = Path(self.config["repositories"]["base_directory"])
         self.output_dir = Path(self.config["analysis"]["output_directory"])
@@ -46,9 +179,41 @@ class GitCommitsAnalyzer:
         self.inclusion_patterns = self.compile_patterns(self.config["exclusions"]["always_include"])
         self.repo_specific_exclusions = self.config["exclusions"].get("repository_specific", {})
 
-        # Thread safety
-        self.print_lock = Lock()
-        self.cache_lock = Lock()
+        # Combine global and repository-specific patterns into one include and one exclude regex per repository
+        self.default_filter = (
+            self.combine_patterns(self.inclusion_patterns),
+            self.combine_patterns(self.exclusion_patterns),
+        )
+        self.repo_filters: dict[str, tuple] = {}
+        for repo_name, repo_config in self.repo_specific_exclusions.items():
+            repo_config = repo_config or {}
+            repo_inclusions = self.compile_patterns(repo_config.get("include_patterns", []))
+            repo_exclusions = self.compile_patterns(repo_config.get("exclude_patterns", []))
+            self.repo_filters[repo_name] = (
+                self.combine_patterns(self.inclusion_patterns + repo_inclusions),
+                self.combine_patterns(repo_exclusions + self.exclusion_patterns),
+            )
+        # Repositories in the include_all list don't exclude anything
+        for repo_name in self.include_all_repos:
+            self.repo_filters[repo_name] = (None, None)
+
+        # Cached commit documents depend on these settings, a change invalidates them
+        analysis_config = {k: v for k, v in self.config["analysis"].items() if k != "output_directory"}
+        self.config_hash = hashlib.sha256(
+            orjson.dumps(
+                [
+                    analysis_config,
+                    self.config.get("email_mapping"),
+                    self.config["exclusions"],
+                    self.config["repositories"].get("include_all_files"),
+                    self.config.get("metrics"),
+                ],
+                option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            )
+        ).hexdigest()
+
+        # Exclusion decisions per (repository, path), see should_exclude_file
+        self.exclude_cache: dict[tuple[str, bytes], bool] = {}
 
         # Get max workers from config or use default
         max_workers_config = self.config.get("parallelization", {}).get("max_workers")
@@ -62,7 +227,7 @@ class GitCommitsAnalyzer:
             sys.exit(1)
 
         with config_path.open("r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
 
     def load_cache(self) -> dict:
         """Load cache from file."""
@@ -70,51 +235,85 @@ class GitCommitsAnalyzer:
             return {}
 
         try:
-            with self.cache_file.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError) as e:
+            with self.cache_file.open("rb") as f:
+                return orjson.loads(f.read())
+        except (orjson.JSONDecodeError, OSError) as e:
             print(f"Warning: Could not load cache: {e}")
             return {}
 
     def save_cache(self):
         """Save cache to file."""
         try:
-            with self.cache_file.open("w", encoding="utf-8") as f:
-                json.dump(self.cache, f, indent=2)
+            write_file_atomically(self.cache_file, orjson.dumps(self.cache, option=orjson.OPT_INDENT_2))
         except OSError as e:
             print(f"Warning: Could not save cache: {e}")
 
     def get_repo_state(self, repo_path: Path) -> str:
-        """Get current state of repository (all branch heads and tags)."""
+        """Get current state of repository (all branch heads and tags) without spawning git."""
+        git_dir = repo_path / ".git"
+        if not git_dir.is_dir():
+            # Worktrees and submodules use a .git file pointing elsewhere, let git resolve it
+            return self.get_repo_state_from_git(repo_path)
+
+        # Every ref update rewrites one of these files, changing its mtime
+        state = hashlib.sha256()
+
+        def add_file(ref_file: Path):
+            try:
+                stat = ref_file.stat()
+            except OSError:
+                return
+            relative_path = ref_file.relative_to(git_dir).as_posix()
+            state.update(f"{relative_path} {stat.st_mtime_ns} {stat.st_size}\n".encode())
+
+        for ref_file in ("HEAD", "packed-refs", "reftable/tables.list"):
+            add_file(git_dir / ref_file)
+
+        for root, dirs, files in (git_dir / "refs").walk():
+            dirs.sort()
+            for name in sorted(files):
+                add_file(root / name)
+
+        return state.hexdigest()
+
+    def get_repo_state_from_git(self, repo_path: Path) -> str:
+        """Hash the output of git show-ref."""
         try:
             # Get all refs (branches and tags) with their commit hashes
-            result = subprocess.run(
-                ["git", "-C", str(repo_path), "show-ref"], capture_output=True, text=True, check=True, encoding="utf-8"
-            )
+            result = subprocess.run(["git", "-C", str(repo_path), "show-ref"], capture_output=True, check=True)
 
             # Create a hash of all refs to detect any changes
-            return hashlib.sha256(result.stdout.encode()).hexdigest()
+            return hashlib.sha256(result.stdout).hexdigest()
         except subprocess.CalledProcessError:
             # If command fails, return empty state
             return ""
 
-    def is_repo_changed(self, repo_path: Path) -> bool:
+    def is_repo_changed(self, repo_path: Path, current_state: str) -> bool:
         """Check if repository has changed since last analysis."""
         repo_name = repo_path.name
-        current_state = self.get_repo_state(repo_path)
 
         if not current_state:
             return True  # If we can't get state, assume changed
 
-        cached_state = self.cache.get(repo_name, {}).get("state")
+        cached_entry = self.load_repo_metadata(repo_name)
 
-        if cached_state != current_state:
+        if cached_entry.get("state") != current_state or cached_entry.get("config_hash") != self.config_hash:
             return True
 
         # Also check if cached data file exists
         cached_data_file = self.cache_dir / f"{repo_name}_commits.json"
         return bool(not cached_data_file.exists())
 
+    def load_repo_metadata(self, repo_name: str) -> dict:
+        """Load the cache metadata a worker wrote for a repository, falling back to the aggregated cache."""
+        metadata_file = self.cache_dir / f"{repo_name}.meta.json"
+
+        try:
+            with metadata_file.open("rb") as f:
+                return orjson.loads(f.read())
+        except (orjson.JSONDecodeError, OSError):
+            return self.cache.get(repo_name, {})
+
     def load_cached_repo_data(self, repo_path: Path) -> list[dict] | None:
         """Load cached analysis data for a repository."""
         repo_name = repo_path.name
@@ -124,30 +323,32 @@ class GitCommitsAnalyzer:
             return None
 
         try:
-            with cached_data_file.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError) as e:
+            with cached_data_file.open("rb") as f:
+                return orjson.loads(f.read())
+        except (orjson.JSONDecodeError, OSError) as e:
             print(f"Warning: Could not load cached data for {repo_name}: {e}")
             return None
 
-    def save_repo_data_to_cache(self, repo_path: Path, commits_data: list[dict]):
+    def save_repo_data_to_cache(self, repo_path: Path, commits_data: list[dict], state: str, head_shas: list[str]):
         """Save repository analysis data to cache."""
         repo_name = repo_path.name
-        current_state = self.get_repo_state(repo_path)
         cached_data_file = self.cache_dir / f"{repo_name}_commits.json"
 
+        metadata = {
+            "state": state,
+            "timestamp": datetime.now(UTC).isoformat(),
+            "commit_count": len(commits_data),
+            "last_head_shas": head_shas,
+            "config_hash": self.config_hash,
+        }
+
         try:
-            # Save the commits data
-            with cached_data_file.open("w", encoding="utf-8") as f:
-                json.dump(commits_data, f)
-
-            # Update cache metadata
-            with self.cache_lock:
-                self.cache[repo_name] = {
-                    "state": current_state,
-                    "timestamp": datetime.now(UTC).isoformat(),
-                    "commit_count": len(commits_data),
-                }
+            # Save the commits data; only read back by this script, so no indentation
+            write_file_atomically(cached_data_file, orjson.dumps(commits_data))
+
+            # Each worker writes its own metadata file, collected into the cache file by the main process
+            write_file_atomically(self.cache_dir / f"{repo_name}.meta.json", orjson.dumps(metadata))
+            self.cache[repo_name] = metadata
         except OSError as e:
             print(f"Warning: Could not save cache for {repo_name}: {e}")
 
@@ -174,42 +375,77 @@ class GitCommitsAnalyzer:
                 print(f"Warning: Invalid regex pattern '{pattern}': {e}")
         return compiled
 
+    def combine_patterns(self, patterns: list[tuple[re.Pattern, str]]):
+        """Combine compiled patterns into a single matcher, or None if there are none."""
+        if not patterns:
+            return None
+
+        matcher = self.combine_regexes(patterns)
+
+        # Most paths match none of the patterns; if each pattern requires a literal, check those first
+        literals = {required_literal(pattern.pattern) for pattern, _ in patterns}
+        if "" in literals:
+            return matcher
+        return LiteralPrefilter(literals, matcher)
+
+    def combine_regexes(
+        self, patterns: list[tuple[re.Pattern, str]]
+    ) -> re.Pattern | HyperscanPatternSet | Re2PatternSet:
+        """Combine compiled patterns into a single regex matcher."""
+        if hyperscan is not None:
+            try:
+                return HyperscanPatternSet([pattern.pattern for pattern, _ in patterns])
+            except hyperscan.error:
+                # Some Python regex features (e.g. backreferences, lookarounds) are unsupported by Hyperscan
+                pass
+
+        if re2 is not None:
+            try:
+                return Re2PatternSet([pattern.pattern for pattern, _ in patterns])
+            except re2.error:
+                # RE2 lacks backreferences and lookarounds as well
+                pass
+
+        alternatives = []
+        for pattern, _ in patterns:
+            # Leading global flags like (?i) are only valid at the start of the whole expression,
+            # so turn them into flags scoped to this alternative
+            flags = re.match(r"\(\?([aiLmsux]+)\)", pattern.pattern)
+            if flags:
+                alternatives.append(f"(?{flags.group(1)}:{pattern.pattern[flags.end() :]})")
+            else:
+                alternatives.append(f"(?:{pattern.pattern})")
+
+        return re.compile("|".join(alternatives))
+
     def normalize_email(self, email: str) -> str:
         """Normalize email to person name using mapping."""
         email_lower = email.lower()
         return self.email_mapping.get(email_lower, email)
 
-    def should_exclude_file(self, file_path: str, repo_name: str) -> bool:
-        """Determine if a file should be excluded from analysis."""
-        # If repository is in include_all list, don't exclude anything
-        if repo_name in self.include_all_repos:
-            return False
-
-        # Check if file matches any inclusion pattern (these override exclusions)
-        for pattern, _ in self.inclusion_patterns:
-            if pattern.match(file_path):
-                return False
-
-        # Check repository-specific exclusions
-        if repo_name in self.repo_specific_exclusions:
-            repo_config = self.repo_specific_exclusions[repo_name]
+    def should_exclude_file(self, file_path: bytes, repo_name: str) -> bool:
+        """Determine if a file should be excluded from analysis, remembering the decision."""
+        # The same paths are touched by many commits, so most lookups hit the cache;
+        # the path as output by git is only decoded for the patterns on a miss
+        key = (repo_name, file_path)
+        excluded = self.exclude_cache.get(key)
+        if excluded is None:
+            if len(self.exclude_cache) >= EXCLUDE_CACHE_SIZE:
+                self.exclude_cache.clear()
+            excluded = self.exclude_cache[key] = self.matches_exclusions(
+                file_path.decode("utf-8", "replace"), repo_name
+            )
+        return excluded
 
-            # Check repository-specific inclusions
-            if "include_patterns" in repo_config:
-                for item in repo_config["include_patterns"]:
-                    pattern = re.compile(item["pattern"])
-                    if pattern.match(file_path):
-                        return False
+    def matches_exclusions(self, file_path: str, repo_name: str) -> bool:
+        """Check a file against the inclusion and exclusion patterns of its repository."""
+        include_pattern, exclude_pattern = self.repo_filters.get(repo_name, self.default_filter)
 
-            # Check repository-specific exclusions
-            if "exclude_patterns" in repo_config:
-                for item in repo_config["exclude_patterns"]:
-                    pattern = re.compile(item["pattern"])
-                    if pattern.match(file_path):
-                        return True
+        # Inclusion patterns override exclusions
+        if include_pattern and include_pattern.match(file_path):
+            return False
 
-        # Check global exclusion patterns
-        return any(pattern.match(file_path) for pattern, _ in self.exclusion_patterns)
+        return bool(exclude_pattern and exclude_pattern.match(file_path))
 
     def normalize_message(self, message: str) -> str:
         """Normalize commit message by removing line breaks."""
@@ -218,170 +454,295 @@ class GitCommitsAnalyzer:
             return " ".join(message.split())
         return message
 
-    def parse_git_log_line(self, line: str) -> dict | None:
-        """Parse a git log line into commit information."""
-        # Format: HASH|||EMAIL|||NAME|||TIMESTAMP|||MESSAGE
-        parts = line.split("|||")
-        if len(parts) < 5:
-            return None
+    def parse_commit_header(self, fields: list[bytes]) -> dict:
+        """Parse the NUL-separated git log header fields into commit information."""
+        # Format: HASH, EMAIL, NAME, TIMESTAMP, MESSAGE
+        commit_id, email, name, timestamp, message = (field.decode("utf-8", "replace").strip() for field in fields)
 
         return {
-            "commit_id": parts[0].strip(),
-            "author_email": parts[1].strip().lower(),
-            "author_name": parts[2].strip(),
-            "commit_timestamp": parts[3].strip(),
-            "commit_message": self.normalize_message(parts[4].strip()) if len(parts) > 4 else "",
+            "commit_id": commit_id,
+            "author_email": email.lower(),
+            "author_name": name,
+            "commit_timestamp": timestamp,
+            "commit_message": self.normalize_message(message),
         }
 
-    def get_commit_stats(self, repo_path: Path, commit_hash: str, repo_name: str) -> dict:
-        """Get detailed statistics for a specific commit."""
-        try:
-            # Get file stats with numstat
-            result = subprocess.run(
-                ["git", "-C", str(repo_path), "show", "--numstat", "--format=", commit_hash],
-                capture_output=True,
-                text=True,
-                check=True,
-                encoding="utf-8",
-            )
-
-            insertions = 0
-            deletions = 0
-            files_changed = 0
-
-            for line in result.stdout.strip().split("\n"):
-                if not line:
-                    continue
-
-                parts = line.split("\t")
-                if len(parts) < 3:
-                    continue
-
-                added = parts[0]
-                removed = parts[1]
-                file_path = parts[2]
-
-                # Skip binary files
-                if added == "-" or removed == "-":
-                    continue
-
-                try:
-                    added_int = int(added)
-                    removed_int = int(removed)
-                except ValueError:
-                    continue
-
-                # Only count files that pass the exclusion filters
-                if not self.should_exclude_file(file_path, repo_name):
-                    insertions += added_int
-                    deletions += removed_int
-                    files_changed += 1
-
-            return {
-                "files_changed": files_changed,
-                "insertions": insertions,
-                "deletions": deletions,
-                "lines_changed": insertions + deletions,
-            }
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error getting stats for commit {commit_hash}: {e}")
-            return {"files_changed": 0, "insertions": 0, "deletions": 0, "lines_changed": 0}
+    def read_nul_separated(self, stream: BinaryIO) -> Iterator[bytes]:
+        """Yield the NUL-separated fields of a stream as they arrive."""
+        pending = b""
+        while chunk := stream.read1(1024 * 1024):
+            fields = (pending + chunk).split(b"\0")
+            pending = fields.pop()
+            yield from fields
+        if pending:
+            yield pending
 
     def analyze_repository(self, repo_path: Path) -> list[dict]:
-        """Analyze a single repository and return commit data. Thread-safe."""
+        """Analyze a single repository and return commit data."""
         repo_name = repo_path.name
 
+        # Read the ref state before walking the history, so commits added meanwhile are picked up next run
+        current_state = self.get_repo_state(repo_path)
+
         # Check if repository has changed
-        if not self.is_repo_changed(repo_path):
-            with self.print_lock:
-                print(f"Repository unchanged (using cache): {repo_name}")
+        if not self.is_repo_changed(repo_path, current_state):
+            print(f"Repository unchanged (using cache): {repo_name}")
             cached_data = self.load_cached_repo_data(repo_path)
             if cached_data is not None:
-                with self.print_lock:
-                    print(f"  Loaded {len(cached_data)} commits from cache")
+                print(f"  Loaded {len(cached_data)} commits from cache")
                 return cached_data
 
-        with self.print_lock:
+        head_shas = self.get_head_shas(repo_path)
+
+        # Commits never change, so documents cached under the same configuration can be reused by commit id
+        cached_entry = self.load_repo_metadata(repo_name)
+        cached_commits = {}
+        if not self.full_rescan and cached_entry.get("config_hash") == self.config_hash:
+            cached_commits = {commit["commit_id"]: commit for commit in self.load_cached_repo_data(repo_path) or []}
+
+        previous_head_shas = cached_entry.get("last_head_shas")
+
+        if cached_commits and previous_head_shas and self.is_history_extended(repo_path, previous_head_shas):
+            # Refs were only moved forward or added: walk just the new commits
+            print(f"Analyzing new commits in repository: {repo_name}")
+            new_commits = self.run_git_log(repo_path, exclude=previous_head_shas)
+            if new_commits is None:
+                return []
+
+            # A commit may be reported again if it was added while the previous run was walking the history
+            commits_by_id = {commit["commit_id"]: commit for commit in new_commits}
+            for commit_id, commit in cached_commits.items():
+                commits_by_id.setdefault(commit_id, commit)
+            commits_data = list(commits_by_id.values())
+            print(f"  Found {len(new_commits)} new commits ({len(commits_data)} total)")
+        elif cached_commits:
+            # History was rewritten: list the commits, but only get stats for the ones not analyzed before
+            print(f"Analyzing changed history of repository: {repo_name}")
+            commit_ids = self.list_commit_ids(repo_path)
+            if commit_ids is None:
+                return []
+
+            missing_commit_ids = [commit_id for commit_id in commit_ids if commit_id not in cached_commits]
+            new_commits = self.run_git_log(repo_path, only=missing_commit_ids) if missing_commit_ids else []
+            if new_commits is None:
+                return []
+
+            new_commits_by_id = {commit["commit_id"]: commit for commit in new_commits}
+            commits_data = [
+                new_commits_by_id[commit_id] if commit_id in new_commits_by_id else cached_commits[commit_id]
+                for commit_id in commit_ids
+                if commit_id in new_commits_by_id or commit_id in cached_commits
+            ]
+            print(f"  Found {len(new_commits)} new commits ({len(commits_data)} total)")
+        else:
             print(f"Analyzing repository: {repo_name}")
+            commits_data = self.run_git_log(repo_path)
+            if commits_data is None:
+                return []
+            print(f"  Found {len(commits_data)} commits")
 
-        # Build git log command
-        cmd = ["git", "-C", str(repo_path), "log", "--format=%H|||%ae|||%an|||%cI|||%s"]
+        # Save to cache
+        self.save_repo_data_to_cache(repo_path, commits_data, state=current_state, head_shas=head_shas)
+
+        return commits_data
+
+    def get_head_shas(self, repo_path: Path) -> list[str]:
+        """Get the commits the analyzed refs point to."""
+        revision = "--all" if self.config["analysis"]["all_branches"] else "HEAD"
+        result = subprocess.run(["git", "-C", str(repo_path), "rev-parse", revision], capture_output=True)
+        if result.returncode != 0:
+            return []
+        # Object ids are plain ASCII
+        return sorted({sha.decode("ascii") for sha in result.stdout.split()})
 
-        # Add branch filter
-        if self.config["analysis"]["all_branches"]:
-            cmd.append("--all")
+    def estimate_repo_size(self, repo_path: Path) -> int:
+        """Estimate the size of a repository's history from its pack files, without walking it."""
+        # Cloned and fetched objects are stored in packs; the few loose objects don't change the order much.
+        # Worktrees and submodules (.git is a file) count as empty.
+        try:
+            with os.scandir(repo_path / ".git" / "objects" / "pack") as entries:
+                return sum(entry.stat().st_size for entry in entries if entry.name.endswith(".pack"))
+        except OSError:
+            return 0
+
+    def is_history_extended(self, repo_path: Path, previous_head_shas: list[str]) -> bool:
+        """Check that every commit reachable from the previous heads is still reachable from the analyzed refs."""
+        revision = "--all" if self.config["analysis"]["all_branches"] else "HEAD"
+        result = subprocess.run(
+            ["git", "-C", str(repo_path), "rev-list", "--max-count=1", "--stdin", "--not", revision],
+            input="".join(f"{sha}\n" for sha in previous_head_shas).encode(),
+            capture_output=True,
+        )
+        # Fails if a previous head no longer exists, e.g. after a force push and garbage collection
+        return result.returncode == 0 and not result.stdout.strip()
+
+    def git_log_options(self, walk_refs: bool = True) -> list[str]:
+        """Build the git log options that select the commits to analyze."""
+        options = []
+
+        # Add branch filter; HEAD is named explicitly since git only defaults to it when no revision is given,
+        # and excluded commits passed on stdin count as revisions
+        if walk_refs:
+            options.append("--all" if self.config["analysis"]["all_branches"] else "HEAD")
 
         # Add merge commit filter
         if self.config["analysis"]["exclude_merge_commits"]:
-            cmd.append("--no-merges")
+            options.append("--no-merges")
 
         # Add date range filters
         start_date = self.config["analysis"].get("start_date")
         end_date = self.config["analysis"].get("end_date")
 
         if start_date:
-            cmd.append(f"--since={start_date}")
+            options.append(f"--since={start_date}")
         if end_date:
-            cmd.append(f"--until={end_date}")
+            options.append(f"--until={end_date}")
+
+        return options
+
+    def list_commit_ids(self, repo_path: Path) -> list[str] | None:
+        """List the ids of the commits to analyze, without computing any diffs. Returns None on error."""
+        result = subprocess.run(
+            ["git", "-C", str(repo_path), "log", "--format=%H", *self.git_log_options()],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            print(f"Error running git log for {repo_path.name}: {result.stderr.decode('utf-8', 'replace').strip()}")
+            return None
+        return [commit_id.decode("ascii") for commit_id in result.stdout.split()]
 
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True, encoding="utf-8")
-        except subprocess.CalledProcessError as e:
-            with self.print_lock:
-                print(f"Error running git log for {repo_name}: {e}")
-            return []
+    def run_git_log(
+        self, repo_path: Path, exclude: list[str] | None = None, only: list[str] | None = None
+    ) -> list[dict] | None:
+        """Collect commits and their stats. Returns None on error.
+
+        Commits reachable from exclude are skipped; if only is given, just those commits are reported.
+        """
+        repo_name = repo_path.name
+
+        # Build git log command; --numstat emits the per-file stats right after each commit header.
+        # With -z every header field and path is NUL-terminated, so no separator can clash with their content.
+        cmd = ["git", "-C", str(repo_path), "log", "-z", "--format=%H%x00%ae%x00%an%x00%cI%x00%s", "--numstat"]
+        cmd.extend(self.git_log_options(walk_refs=only is None))
+        if not self.config["analysis"]["exclude_merge_commits"]:
+            # Report merge commits the same way `git show` does
+            cmd.append("--cc")
+
+        # Revisions are passed on stdin, there can be more than fit on a command line
+        if only is not None:
+            cmd.extend(["--no-walk=unsorted", "--stdin"])
+            revisions = only
+        elif exclude:
+            cmd.append("--stdin")
+            revisions = [f"^{sha}" for sha in exclude]
+        else:
+            revisions = None
 
         commits_data = []
+        commit_info = None
+        header = []
+        stats = {"files_changed": 0, "insertions": 0, "deletions": 0}
+
+        # Parse the output while git is still walking the history instead of buffering all of it first.
+        # A commit hash starts a new commit: its header fields follow, then its numstat entries.
+        with subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if revisions else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=1024 * 1024,  # Fewer read() calls on large histories
+        ) as proc:
+            if revisions:
+                proc.stdin.write("".join(f"{revision}\n" for revision in revisions).encode())
+                proc.stdin.close()
+
+            fields = self.read_nul_separated(proc.stdout)
+            for field in fields:
+                if header:
+                    header.append(field)
+                    if len(header) == 5:
+                        commit_info = self.parse_commit_header(header)
+                        stats = {"files_changed": 0, "insertions": 0, "deletions": 0}
+                        header = []
+                    continue
 
-        for line in result.stdout.strip().split("\n"):
-            if not line:
-                continue
-
-            commit_info = self.parse_git_log_line(line)
-            if not commit_info:
-                continue
-
-            # Get commit statistics
-            stats = self.get_commit_stats(repo_path, commit_info["commit_id"], repo_name)
-
-            # Normalize author name
-            author_name = self.normalize_email(commit_info["author_email"])
-
-            # Build commit document
-            commit_doc = {
-                "repository": repo_name,
-                "commit_id": commit_info["commit_id"],
-                "author_email": commit_info["author_email"],
-                "author_name": author_name,
-                "commit_timestamp": commit_info["commit_timestamp"],
-                "files_changed": stats["files_changed"],
-                "insertions": stats["insertions"],
-                "deletions": stats["deletions"],
-                "lines_changed": stats["lines_changed"],
-            }
+                # Numstat entries are "added<TAB>removed<TAB>path"; locate the tabs instead of splitting,
+                # which would allocate a list per entry
+                first_tab = field.find(b"\t")
+                if first_tab < 0:
+                    if field.strip():
+                        if commit_info:
+                            commits_data.append(self.build_commit_doc(repo_name, commit_info, stats))
+                        commit_info = None
+                        header = [field]
+                    continue
 
-            commits_data.append(commit_doc)
+                second_tab = field.find(b"\t", first_tab + 1)
+                if second_tab < 0:
+                    continue
 
-        with self.print_lock:
-            print(f"  Found {len(commits_data)} commits")
+                # The first entry of a commit starts with a newline, which int() ignores
+                added = field[:first_tab]
+                removed = field[first_tab + 1 : second_tab]
+                file_path = field[second_tab + 1 :]
+                if not file_path:
+                    # Renames and copies are followed by the old and the new path
+                    next(fields, None)
+                    file_path = next(fields, b"")
 
-        # Save to cache
-        self.save_repo_data_to_cache(repo_path, commits_data)
+                if not commit_info:
+                    continue
+
+                # Skip binary files, reported as "-<TAB>-"
+                if removed == b"-":
+                    continue
+
+                try:
+                    added_int = int(added)
+                    removed_int = int(removed)
+                except ValueError:
+                    continue
+
+                # Only count files that pass the exclusion filters
+                if not self.should_exclude_file(file_path, repo_name):
+                    stats["insertions"] += added_int
+                    stats["deletions"] += removed_int
+                    stats["files_changed"] += 1
+
+            stderr = proc.stderr.read()
+
+        if proc.returncode != 0:
+            print(f"Error running git log for {repo_name}: {stderr.decode('utf-8', 'replace').strip()}")
+            return None
+
+        if commit_info:
+            commits_data.append(self.build_commit_doc(repo_name, commit_info, stats))
 
         return commits_data
 
-    def generate_bulk_data(self, commits_data: list[dict], index_name: str) -> str:
-        """Generate Elasticsearch bulk upload format."""
-        bulk_lines = []
+    def build_commit_doc(self, repo_name: str, commit_info: dict, stats: dict) -> dict:
+        """Build the Elasticsearch document for a single commit."""
+        return {
+            "repository": repo_name,
+            "commit_id": commit_info["commit_id"],
+            "author_email": commit_info["author_email"],
+            "author_name": self.normalize_email(commit_info["author_email"]),
+            "commit_timestamp": commit_info["commit_timestamp"],
+            "files_changed": stats["files_changed"],
+            "insertions": stats["insertions"],
+            "deletions": stats["deletions"],
+            "lines_changed": stats["insertions"] + stats["deletions"],
+        }
 
+    def generate_bulk_data(self, commits_data: list[dict], index_name: str, out_fh: BinaryIO):
+        """Write commits to out_fh in Elasticsearch bulk upload format."""
         for commit in commits_data:
             # Index action
             action = {"index": {"_index": index_name, "_id": f"{commit['repository']}_{commit['commit_id']}"}}
-            bulk_lines.append(json.dumps(action))
-            bulk_lines.append(json.dumps(commit))
-
-        return "\n".join(bulk_lines) + "\n"
+            out_fh.write(orjson.dumps(action))
+            out_fh.write(b"\n")
+            out_fh.write(orjson.dumps(commit))
+            out_fh.write(b"\n")
 
     def analyze_all_repositories(self):
         """Analyze all repositories in parallel and generate bulk upload files."""
@@ -397,22 +758,49 @@ class GitCommitsAnalyzer:
             repo_paths = [self.repos_dir / repo for repo in repos_to_analyze]
         else:
             # Analyze all subdirectories
-            repo_paths = [p for p in self.repos_dir.iterdir() if p.is_dir() and (p / ".git").exists()]
+            # DirEntry.is_dir() uses the file type from the directory listing instead of another stat() call
+            with os.scandir(self.repos_dir) as entries:
+                repo_paths = [
+                    Path(entry.path) for entry in entries if entry.is_dir() and Path(entry.path, ".git").exists()
+                ]
 
         if not repo_paths:
             print("No repositories found to analyze")
             return
 
+        # Start the largest repositories first, so the run doesn't end waiting on one that was submitted last
+        repo_sizes = {repo_path: self.estimate_repo_size(repo_path) for repo_path in repo_paths}
+        repo_paths.sort(key=repo_sizes.get, reverse=True)
+        max_workers = min(self.max_workers, len(repo_paths))
+
         print(f"Found {len(repo_paths)} repositories to analyze")
-        print(f"Using {self.max_workers} parallel workers\n")
+        print(f"Using {max_workers} parallel workers\n")
 
-        all_commits = []
+        index_name = self.config["elasticsearch"]["commit_index"]
+        output_file = self.output_dir / "commits-bulk.json"
+        partial_output_file = self.output_dir / "commits-bulk.json.tmp"
+        summary = {
+            "total_commits": 0,
+            "insertions": 0,
+            "deletions": 0,
+            "lines_changed": 0,
+            "repositories": set(),
+            "contributors": set(),
+        }
 
-        # Parallelize repository analysis
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+        # Parallelize repository analysis across processes; parsing and path filtering are CPU-bound.
+        # Each repository's commits are written out as soon as it is done, so they are never all held at once.
+        with (
+            partial_output_file.open("wb") as bulk_file,
+            ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=init_worker,
+                initargs=(self.config_file, self.full_rescan),
+            ) as executor,
+        ):
             # Submit all repository analysis tasks
             future_to_repo = {
-                executor.submit(self.analyze_repository, repo_path): repo_path for repo_path in repo_paths
+                executor.submit(analyze_repository_in_worker, repo_path): repo_path for repo_path in repo_paths
             }
 
             # Collect results as they complete
@@ -420,43 +808,48 @@ class GitCommitsAnalyzer:
                 repo_path = future_to_repo[future]
                 try:
                     commits = future.result()
-                    all_commits.extend(commits)
+                    self.generate_bulk_data(commits, index_name, bulk_file)
+                    self.update_summary(summary, commits)
                 except Exception as e:
-                    with self.print_lock:
-                        print(f"Error analyzing {repo_path.name}: {e}")
+                    print(f"Error analyzing {repo_path.name}: {e}")
 
-        print(f"\nTotal commits analyzed: {len(all_commits)}")
+        print(f"\nTotal commits analyzed: {summary['total_commits']}")
 
-        # Save cache metadata
+        # Collect the metadata written by the workers into the cache file
+        for repo_path in repo_paths:
+            metadata = self.load_repo_metadata(repo_path.name)
+            if metadata:
+                self.cache[repo_path.name] = metadata
         self.save_cache()
 
-        # Generate bulk upload file
-        index_name = self.config["elasticsearch"]["commit_index"]
-        bulk_data = self.generate_bulk_data(all_commits, index_name)
-
-        output_file = self.output_dir / "commits-bulk.json"
-        with output_file.open("w", encoding="utf-8") as f:
-            f.write(bulk_data)
+        # Only replace the previous bulk upload file once the new one is complete
+        partial_output_file.replace(output_file)
 
         print(f"Bulk upload file generated: {output_file}")
 
         # Generate summary statistics
-        self.generate_summary(all_commits)
-
-    def generate_summary(self, commits_data: list[dict]):
+        self.generate_summary(summary)
+
+    def update_summary(self, summary: dict, commits_data: list[dict]):
+        """Add a repository's commits to the running summary statistics."""
+        summary["total_commits"] += len(commits_data)
+        summary["insertions"] += sum(c["insertions"] for c in commits_data)
+        summary["deletions"] += sum(c["deletions"] for c in commits_data)
+        summary["lines_changed"] += sum(c["lines_changed"] for c in commits_data)
+        summary["repositories"].update(c["repository"] for c in commits_data)
+        summary["contributors"].update(c["author_name"] for c in commits_data)
+
+    def generate_summary(self, summary: dict):
         """Generate summary statistics."""
         summary = {
-            "total_commits": len(commits_data),
-            "insertions": sum(c["insertions"] for c in commits_data),
-            "deletions": sum(c["deletions"] for c in commits_data),
-            "lines_changed": sum(c["lines_changed"] for c in commits_data),
-            "repositories": len({c["repository"] for c in commits_data}),
-            "contributors": len({c["author_name"] for c in commits_data}),
+            **summary,
+            "repositories": len(summary["repositories"]),
+            "contributors": len(summary["contributors"]),
         }
 
         summary_file = self.output_dir / "commits-summary.json"
-        with summary_file.open("w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2)
+        with summary_file.open("wb") as f:
+            f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
 
         print("\nSummary:")
         print(f"  Total commits: {summary['total_commits']:,}")
@@ -465,6 +858,24 @@ class GitCommitsAnalyzer:
         print(f"  Total lines changed: {summary['lines_changed']:,}")
 
 
+# Analyzer of the current worker process, set up once by init_worker
+worker_analyzer: GitCommitsAnalyzer | None = None
+
+
+def init_worker(config_file: str, full_rescan: bool):
+    """Build the analyzer (email mapping, compiled patterns) once per worker process."""
+    global worker_analyzer
+    # Write each line in one go so output of concurrent workers doesn't interleave mid-line,
+    # even when stdout is unbuffered (PYTHONUNBUFFERED)
+    sys.stdout.reconfigure(line_buffering=True, write_through=False)
+    worker_analyzer = GitCommitsAnalyzer(config_file, full_rescan=full_rescan)
+
+
+def analyze_repository_in_worker(repo_path: Path) -> list[dict]:
+    """Analyze a repository in a worker process and return its commits."""
+    return worker_analyzer.analyze_repository(repo_path)
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(
@@ -475,10 +886,15 @@ def main():
         "config_file",
         help="Path to the YAML configuration file",
     )
+    parser.add_argument(
+        "--full-rescan",
+        action="store_true",
+        help="Re-analyze the full history of changed repositories instead of only their new commits",
+    )
 
     args = parser.parse_args()
 
-    analyzer = GitCommitsAnalyzer(args.config_file)
+    analyzer = GitCommitsAnalyzer(args.config_file, full_rescan=args.full_rescan)
     analyzer.analyze_all_repositories()
 
 
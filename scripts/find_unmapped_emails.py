@@ -5,22 +5,44 @@ Scans all repositories and identifies email addresses that are not mapped in the
 """
 
 import argparse
+import os
+import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml, use the pure Python parser
+    from yaml import SafeLoader
+
+# CPython only starts processes with posix_spawn() instead of fork() + exec() for an absolute executable path
+GIT = shutil.which("git") or "git"
+
 
 class UnmappedEmailFinder:
-    def __init__(self, config_file: str):
+    def __init__(self, config_file: str, since: str | None = None):
         """Initialize the finder with configuration."""
         self.config = self.load_config(config_file)
         self.repos_dir = Path(self.config["repositories"]["base_directory"])
 
+        # Skip older commits; defaults to the analysis start date, as earlier commits aren't analyzed anyway
+        self.since = (
+            since
+            or self.config["repositories"].get("email_scan_since")
+            or self.config.get("analysis", {}).get("start_date")
+        )
+
         # Build email mapping
         self.email_mapping = self.build_email_mapping()
 
+        # Get max workers from config or use default
+        max_workers_config = self.config.get("parallelization", {}).get("max_workers")
+        self.max_workers = max_workers_config if max_workers_config is not None else (os.cpu_count() or 4)
+
     def load_config(self, config_file: str) -> dict:
         """Load configuration from YAML file."""
         config_path = Path(config_file)
@@ -29,32 +51,62 @@ class UnmappedEmailFinder:
             sys.exit(1)
 
         with config_path.open() as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
 
-    def build_email_mapping(self) -> set[str]:
+    def build_email_mapping(self) -> frozenset[str]:
         """Build set of mapped emails from config (lowercase)."""
         email_mapping_config = self.config.get("email_mapping", {})
-        mapped_emails = set()
-
-        for _person, emails in email_mapping_config.items():
-            for email in emails:
-                mapped_emails.add(email.lower())
-
-        return mapped_emails
+        return frozenset(email.lower() for emails in email_mapping_config.values() for email in emails)
 
     def get_all_emails_from_repo(self, repo_path: Path) -> set[str]:
         """Get all unique email addresses from a repository."""
-        cmd = ["git", "-C", str(repo_path), "log", "--format=%ae", "--all"]
+        options = ["--all"]
+        if self.config.get("analysis", {}).get("exclude_merge_commits", False):
+            options.append("--no-merges")
+        if self.since:
+            options.append(f"--since={self.since}")
+
+        # Let git deduplicate: shortlog prints one "count<TAB>email" line per author email instead of one per commit.
+        # Grouping by %ae keeps the raw email, unlike -e which applies the mailmap.
+        try:
+            return self.read_emails(
+                [GIT, "--no-pager", "-C", str(repo_path), "shortlog", "-s", "--group=format:%ae", *options]
+            )
+        except subprocess.CalledProcessError:
+            # shortlog only supports --group=format since git 2.39, and fails in repositories without refs;
+            # fall back to listing the email of every commit
+            pass
 
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            emails = {line.strip().lower() for line in result.stdout.split("\n") if line.strip()}
-            return emails
+            return self.read_emails([GIT, "--no-pager", "-C", str(repo_path), "log", "--format=%ae", *options])
         except subprocess.CalledProcessError as e:
             print(f"Error getting emails from {repo_path.name}: {e}", file=sys.stderr)
             return set()
 
-    def find_unmapped_emails(self) -> dict[str, set[str]]:
+    def read_emails(self, cmd: list[str]) -> set[str]:
+        """Run git and collect the emails it prints, one per line after an optional count."""
+        # Read bytes and decode each email on its own: no locale codec or newline translation over the whole output,
+        # and a stray invalid byte can't abort the scan
+        # close_fds=False is also required for posix_spawn(); Python's own file descriptors aren't inheritable anyway
+        with subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=1024 * 1024,
+            close_fds=False,
+        ) as process:
+            emails = {
+                email.decode("utf-8", "replace").lower()
+                for line in process.stdout
+                if (email := line.rpartition(b"\t")[2].strip())
+            }
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+        return emails
+
+    def find_unmapped_emails(self) -> dict[str, list[str]]:
         """Find all unmapped email addresses across all repositories."""
         if not self.repos_dir.exists():
             print(f"Error: Repositories directory not found: {self.repos_dir}")
@@ -68,30 +120,30 @@ class UnmappedEmailFinder:
             repo_paths = [self.repos_dir / repo for repo in repos_to_analyze]
         else:
             # Analyze all subdirectories
-            repo_paths = [p for p in self.repos_dir.iterdir() if p.is_dir() and (p / ".git").exists()]
+            # DirEntry.is_dir() uses the file type from the directory listing instead of another stat() call
+            with os.scandir(self.repos_dir) as entries:
+                repo_paths = [
+                    Path(entry.path) for entry in entries if entry.is_dir() and Path(entry.path, ".git").exists()
+                ]
 
         if not repo_paths:
             print("No repositories found to analyze")
             return {}
 
-        all_emails = set()
-        repo_email_map = {}
+        # Map each email to the repositories it appears in, in repository order
+        email_to_repos: dict[str, list[str]] = {}
 
-        for repo_path in repo_paths:
-            emails = self.get_all_emails_from_repo(repo_path)
-            repo_email_map[repo_path.name] = emails
-            all_emails.update(emails)
+        # Each repository is read by its own git process, so threads are enough to run them in parallel
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(repo_paths))) as executor:
+            repo_emails = executor.map(self.get_all_emails_from_repo, repo_paths)
+            for repo_path, emails in zip(repo_paths, repo_emails, strict=True):
+                for email in emails:
+                    email_to_repos.setdefault(email, []).append(repo_path.name)
 
         # Find unmapped emails
-        unmapped_emails = all_emails - self.email_mapping
-
-        # Build a map of unmapped emails to repositories they appear in
-        unmapped_by_repo = {}
-        for email in sorted(unmapped_emails):
-            repos_with_email = [repo for repo, emails in repo_email_map.items() if email in emails]
-            unmapped_by_repo[email] = repos_with_email
+        unmapped_emails = email_to_repos.keys() - self.email_mapping
 
-        return unmapped_by_repo
+        return {email: email_to_repos[email] for email in sorted(unmapped_emails)}
 
     def print_unmapped_emails(self):
         """Find and print unmapped email addresses."""
@@ -130,10 +182,19 @@ def main():
         "config_file",
         help="Path to the YAML configuration file",
     )
+    parser.add_argument(
+        "--since",
+        help=(
+            "Only scan commits newer than this date (anything git accepts, e.g. '2024-01-01' or '2 years ago'). "
+            "Git stops walking the history at the cutoff, which is much faster on long histories, "
+            "but emails only used before it are not reported. "
+            "Defaults to repositories.email_scan_since, then analysis.start_date, otherwise the whole history."
+        ),
+    )
 
     args = parser.parse_args()
 
-    finder = UnmappedEmailFinder(args.config_file)
+    finder = UnmappedEmailFinder(args.config_file, since=args.since)
     finder.print_unmapped_emails()
 
 
@@ -13,10 +13,60 @@ Examples:
 """
 
 import argparse
+import json
+import os
 import sys
 from pathlib import Path
 
-import yaml
+
+def load_config(config_path: Path) -> dict:
+    """Load the configuration, reusing a JSON copy of it while the YAML file is unchanged."""
+    # Bash scripts call this script many times in a row; JSON parses much faster than YAML
+    cache_path = config_path.with_name(f".{config_path.name}.json")
+    stat = config_path.stat()
+    signature = [stat.st_mtime_ns, stat.st_size]
+
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["signature"] == signature:
+            return cached["config"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    # Only import PyYAML when the file actually has to be parsed
+    import yaml
+
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:  # PyYAML built without libyaml, use the pure Python parser
+        from yaml import SafeLoader
+
+    try:
+        with config_path.open("r", encoding="utf-8") as f:
+            config = yaml.load(f, Loader=SafeLoader)
+    except yaml.YAMLError as e:
+        print(f"Error: Failed to parse YAML: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Only keep a copy if JSON represents the configuration exactly, so both paths print the same values;
+    # e.g. dates or non-string keys would come back as strings
+    try:
+        data = json.dumps({"signature": signature, "config": config})
+        cacheable = json.loads(data)["config"] == config
+    except (TypeError, ValueError):
+        cacheable = False
+
+    if cacheable:
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(data, encoding="utf-8")
+            tmp_path.replace(cache_path)
+        except OSError:
+            # The copy is only an optimization, e.g. the config directory may be read-only
+            tmp_path.unlink(missing_ok=True)
+
+    return config
 
 
 def read_config_value(config_file: str, key_path: str):
@@ -27,12 +77,7 @@ def read_config_value(config_file: str, key_path: str):
         print(f"Error: Configuration file not found: {config_file}", file=sys.stderr)
         sys.exit(1)
 
-    try:
-        with config_path.open("r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-    except yaml.YAMLError as e:
-        print(f"Error: Failed to parse YAML: {e}", file=sys.stderr)
-        sys.exit(1)
+    config = load_config(config_path)
 
     # Navigate through nested keys
     keys = key_path.split(".")